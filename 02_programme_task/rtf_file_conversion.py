@@ -301,7 +301,7 @@ def main():
             filename = os.path.basename(filepath)
             output_filename = os.path.splitext(filename)[0] + ".xlsx"
             output_path = os.path.join(CONFIG["OUTPUT_DIR"], output_filename)
-            df.to_excel(output_path, index=False, engine='openpyxl')
+            df.to_excel(output_path, index=False, engine='xlsxwriter')
             print(f"Saved {len(verses)} verses to {output_filename}")
             
             # Add to combined dataset
@@ -311,7 +311,7 @@ def main():
     if all_verses:
         combined_df = pd.DataFrame(all_verses)
         combined_output = os.path.join(CONFIG["OUTPUT_DIR"], "ALL_BOOKS.xlsx")
-        combined_df.to_excel(combined_output, index=False, engine='openpyxl')
+        combined_df.to_excel(combined_output, index=False, engine='xlsxwriter')
         print(f"Saved combined file with {len(all_verses)} verses to ALL_BOOKS.xlsx")
 
 if __name__ == "__main__":
@@ -19,17 +19,17 @@ def clean_text_content(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
+# All apostrophe variants map to the standard ASCII apostrophe
+APOSTROPHE_TABLE = str.maketrans(dict.fromkeys(
+    ['\u2018', '\u2019', '\u0027', '\u0060', '\u00B4', '\u02BC', '\u2032', '\u055A', '\u05F3', '\uFF07'], "'"
+))
+
 def normalize_apostrophes(text):
     """Normalize all types of apostrophes to a standard form for matching"""
     if not text:
         return ""
     
-    # Convert all apostrophe variants to standard ASCII apostrophe
-    apostrophe_variants = ['\u2018', '\u2019', '\u0027', '\u0060', '\u00B4', '\u02BC', '\u2032', '\u055A', '\u05F3', '\uFF07']
-    for variant in apostrophe_variants:
-        text = text.replace(variant, "'")
-    
-    return text
+    return text.translate(APOSTROPHE_TABLE)
 
 def load_txt_subheads(txt_file_path):
     """Load subhead titles from TXT file and clean them"""
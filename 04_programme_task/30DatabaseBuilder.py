@@ -5,22 +5,40 @@ import re
 from rapidfuzz import fuzz
 import glob
 import os
+from collections import defaultdict
 
 # --- XLSX file path ---
 xlsx_file = "CSB_GIFT_01-Genesis_all_spans.xlsx"
 
-# --- Load XLSX file ---
-df = pd.read_excel(xlsx_file, engine='openpyxl')
+# --- Leading verse number on a TXT line ---
+VERSE_RE = re.compile(r'^(\d+)\s*(.*)')
+
+# --- Load XLSX file (parquet copy is reused on re-runs) ---
+def read_excel_cached(excel_file):
+    """Read an Excel file with the calamine engine, reusing a parquet copy from earlier runs."""
+    # Kept identical in each task folder's script; the folders are run standalone
+    parquet_file = excel_file + ".parquet"
+    if os.path.exists(parquet_file) and os.path.getmtime(parquet_file) >= os.path.getmtime(excel_file):
+        return pd.read_parquet(parquet_file)
+
+    df = pd.read_excel(excel_file, engine="calamine")
+    try:
+        df.to_parquet(parquet_file, index=False)
+    except (ImportError, ValueError, TypeError) as e:
+        # Mixed-type columns (or no pyarrow) just mean no cache for this file
+        print(f"Could not cache {excel_file} as parquet: {e}")
+    return df
+
+df = read_excel_cached(xlsx_file)
 
 # --- Clean text function ---
+# Drop zero-width spaces / soft hyphens, flatten en/em dashes
+CLEAN_TABLE = str.maketrans({'\u200b': None, '\u00ad': None, '–': '-', '—': '-'})
+
 def clean_text(text):
     if pd.isna(text):
         return ""
-    text = re.sub(r'[\u200b\u00ad]', '', str(text))
-    text = text.replace('"', '"').replace('"', '"')
-    text = text.replace(''', "'").replace(''', "'")
-    text = text.replace('–', '-').replace('—', '-')
-    return text.strip()
+    return str(text).translate(CLEAN_TABLE).strip()
 
 # --- Reconstruct full verses with chapter ---
 verses = []
@@ -28,9 +46,10 @@ current_chapter = None
 current_verse = None
 current_body = ""
 
-for idx, row in df.iterrows():
-    category = str(row.get('Text Category', '')).upper()
-    content = clean_text(row.get('Span Content', ''))
+categories = df['Text Category'].fillna('').astype(str).str.upper()
+
+for category, raw_content in zip(categories, df['Span Content']):
+    content = clean_text(raw_content)
 
     if "CHAPTER NUMBERS" in category:
         current_chapter = content
@@ -51,6 +70,13 @@ for idx, row in df.iterrows():
 if current_verse is not None and current_body:
     verses.append((current_chapter, current_verse, current_body.strip()))
 
+# --- Index verses by verse number; each (chapter, verse) gets one "used" slot ---
+verse_slots = {}
+candidates_by_verse = defaultdict(list)
+for chap, verse, body in verses:
+    slot = verse_slots.setdefault((chap, verse), len(verse_slots))
+    candidates_by_verse[str(verse)].append((slot, chap, verse, body.lower()))
+
 # --- Process all TXT files in current folder ---
 txt_files = glob.glob("*.txt")
 
@@ -68,28 +94,28 @@ for txt_file in txt_files:
 
     # --- Match TXT fragments using fuzzy matching ---
     output_rows = []
-    used_verses = set()  # Keep track of already matched verses
+    used_verses = bytearray(len(verse_slots))  # Keep track of already matched verses
 
     for line in txt_lines:
-        match_num = re.match(r'^(\d+)\s*(.*)', line)
+        match_num = VERSE_RE.match(line)
         if match_num:
             txt_verse_num = match_num.group(1)
             fragment_text = match_num.group(2).strip()
         else:
             txt_verse_num = None
             fragment_text = line.strip()
+        fragment_lower = fragment_text.lower()
 
         found = False
-        for chap, verse, body in verses:
-            if (chap, verse) in used_verses:
+        for slot, chap, verse, body_lower in candidates_by_verse.get(txt_verse_num, ()):
+            if used_verses[slot]:
                 continue
-            if txt_verse_num is not None and str(verse) == txt_verse_num:
-                score = fuzz.partial_ratio(fragment_text.lower(), body.lower())
-                if score >= 80:  # Threshold for approximate match
-                    output_rows.append([f"Genesis {chap}:{verse}", line])
-                    used_verses.add((chap, verse))
-                    found = True
-                    break
+            score = fuzz.partial_ratio(fragment_lower, body_lower)
+            if score >= 80:  # Threshold for approximate match
+                output_rows.append([f"Genesis {chap}:{verse}", line])
+                used_verses[slot] = 1
+                found = True
+                break
 
         if not found:
             output_rows.append(["Not matched", line])
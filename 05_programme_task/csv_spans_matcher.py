@@ -27,6 +27,7 @@ def clean_subhead_file(raw_file, cleaned_file):
             print(f"⚠️ {raw_file} is empty or already cleaned, skipping.")
             return
 
+        rows = []
         for row in reader:
             if not row:
                 continue
@@ -38,16 +39,22 @@ def clean_subhead_file(raw_file, cleaned_file):
                 ref, sub = parts[0], parts[1] if len(parts) > 1 else ""
             else:
                 ref, sub = line, ""
-            writer.writerow([ref.strip(), sub.strip()])
+            rows.append((ref.strip(), sub.strip()))
+
+        # One batched write; csv.writer still handles quotes/commas in subheads
+        writer.writerows(rows)
 
     print(f"✅ Cleaned file saved as: {cleaned_file}")
 
 
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'"})
+
+
 def normalize_apostrophes(text: str) -> str:
     """Normalize straight and curly apostrophes for reliable matching."""
     if not isinstance(text, str):
         return ""
-    return text.replace("’", "'").replace("‘", "'").strip()
+    return text.translate(_APOSTROPHES).strip()
 
 
 def load_standards(standards_file):
@@ -108,12 +115,40 @@ def check_message(x_coord, acceptable_coords, variance):
     return "MISALIGNED"
 
 
+def read_excel_cached(excel_file):
+    """Read an Excel file with the calamine engine, reusing a parquet copy from earlier runs."""
+    # Kept identical in each task folder's script; the folders are run standalone
+    parquet_file = excel_file + ".parquet"
+    if os.path.exists(parquet_file) and os.path.getmtime(parquet_file) >= os.path.getmtime(excel_file):
+        return pd.read_parquet(parquet_file)
+
+    df = pd.read_excel(excel_file, engine="calamine")
+    try:
+        df.to_parquet(parquet_file, index=False)
+    except (ImportError, ValueError, TypeError) as e:
+        # Mixed-type columns (or no pyarrow) just mean no cache for this file
+        print(f"Could not cache {excel_file} as parquet: {e}")
+    return df
+
+
 def match_subheads_with_spans(cleaned_file, span_file, output_file, standards_file):
     """Match cleaned subheads with span contents from Excel, then check standards.
        Rows with COULD NOT MATCH or MISALIGNED go to the top of the file."""
-    spans_df = pd.read_excel(span_file)
+    spans_df = read_excel_cached(span_file)
+
+    # Only subhead spans can match a subhead; keep everything if the
+    # category naming differs and nothing is tagged as a subhead
+    if "Text Category" in spans_df.columns:
+        is_subhead = spans_df["Text Category"].astype(str).str.upper().str.contains("SUBHEAD", na=False)
+        if is_subhead.any():
+            spans_df = spans_df[is_subhead]
     spans = spans_df.to_dict(orient="records")
 
+    # Normalize span contents once instead of once per subhead
+    normalized_spans = [
+        (normalize_apostrophes(str(span.get("Span Content", ""))), span) for span in spans
+    ]
+
     # Load standards once
     acceptable_coords, variance = load_standards(standards_file)
 
@@ -126,8 +161,7 @@ def match_subheads_with_spans(cleaned_file, span_file, output_file, standards_fi
             subhead = normalize_apostrophes(row["Subhead"])
             match = None
 
-            for span in spans:
-                span_text = normalize_apostrophes(str(span.get("Span Content", "")))
+            for span_text, span in normalized_spans:
                 if span_text == subhead:
                     match = span
                     break
@@ -206,7 +240,9 @@ if __name__ == "__main__":
     else:
         for subhead_file in subhead_files:
             prefix = subhead_file[:3]  # e.g., "01-"
-            span_file_candidates = [f for f in files if f.startswith(prefix) and "_all_spans" in f]
+            span_file_candidates = [
+                f for f in files if f.startswith(prefix) and "_all_spans" in f and f.endswith(".xlsx")
+            ]
 
             if not span_file_candidates:
                 print(f"❌ No span file found for {subhead_file}, skipping.")
@@ -2,72 +2,114 @@
 
 import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+QUOTE_PAIRS = (("’", "'"), ("‘", "'"), ("“", '"'), ("”", '"'))
+_QUOTES = str.maketrans(dict(QUOTE_PAIRS))
+
+# Arrow-backed strings when pyarrow is installed, pandas' own string dtype otherwise
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
 
 def normalize_text(text: str) -> str:
     """Normalize text for comparison (strip, unify quotes)."""
     if not isinstance(text, str):
         return ""
-    return (
-        text.strip()
-        .replace("’", "'")
-        .replace("‘", "'")
-        .replace("“", '"')
-        .replace("”", '"')
-    )
+    return text.strip().translate(_QUOTES)
+
+def read_excel_cached(excel_file):
+    """Read an Excel file with the calamine engine, reusing a parquet copy from earlier runs."""
+    # Kept identical in each task folder's script; the folders are run standalone
+    parquet_file = excel_file + ".parquet"
+    if os.path.exists(parquet_file) and os.path.getmtime(parquet_file) >= os.path.getmtime(excel_file):
+        return pd.read_parquet(parquet_file)
+
+    df = pd.read_excel(excel_file, engine="calamine")
+    try:
+        df.to_parquet(parquet_file, index=False)
+    except (ImportError, ValueError, TypeError) as e:
+        # Mixed-type columns (or no pyarrow) just mean no cache for this file
+        print(f"Could not cache {excel_file} as parquet: {e}")
+    return df
+
+def process_txt_file(txt_path: str, df: pd.DataFrame) -> str:
+    """Match one TXT file against the reference verses and save its results workbook."""
+    # Row lookups for the first hit, so matching never builds a filtered DataFrame
+    references = df["Reference"].tolist()
+    verse_texts = df["Verse Text"].tolist()
+
+    results = []
+
+    with open(txt_path, "r", encoding="utf-8") as f:
+        txt_lines = [normalize_text(line) for line in f if line.strip()]
+
+    for line in txt_lines:
+        # look for verse text that CONTAINS this line
+        mask = df["Normalized"].str.contains(line, na=False, regex=False).to_numpy()
+
+        if mask.any():
+            first = mask.argmax()
+            ref = references[first]
+            verse = verse_texts[first]
+            results.append({
+                "TXT Line": line,
+                "Match Status": "Matched",
+                "Reference": ref,
+                "Verse Text": verse
+            })
+        else:
+            results.append({
+                "TXT Line": line,
+                "Match Status": "Not Matched",
+                "Reference": None,
+                "Verse Text": None
+            })
+
+    # Convert results into DataFrame
+    output_df = pd.DataFrame(results)
+
+    # Move Not Matched rows to the top
+    output_df = pd.concat([
+        output_df[output_df["Match Status"] == "Not Matched"],
+        output_df[output_df["Match Status"] == "Matched"]
+    ])
+
+    # Save results in the same folder as the input TXT file
+    output_path = os.path.splitext(txt_path)[0] + "_results.xlsx"
+    output_df.to_excel(output_path, index=False, engine="xlsxwriter")
+    return output_path
 
 def process_txt_files(txt_folder: str, excel_file: str):
     # Load Excel file
-    df = pd.read_excel(excel_file)
-    df["Normalized"] = df["Verse Text"].apply(normalize_text)
-
-    for txt_file in os.listdir(txt_folder):
-        if txt_file.endswith(".txt"):
-            results = []
-            txt_path = os.path.join(txt_folder, txt_file)
-
-            with open(txt_path, "r", encoding="utf-8") as f:
-                txt_lines = [normalize_text(line) for line in f if line.strip()]
-
-            for line in txt_lines:
-                # look for verse text that CONTAINS this line
-                matched_row = df[df["Normalized"].str.contains(line, na=False, regex=False)]
-
-                if not matched_row.empty:
-                    ref = matched_row.iloc[0]["Reference"]
-                    verse = matched_row.iloc[0]["Verse Text"]
-                    results.append({
-                        "TXT Line": line,
-                        "Match Status": "Matched",
-                        "Reference": ref,
-                        "Verse Text": verse
-                    })
-                else:
-                    results.append({
-                        "TXT Line": line,
-                        "Match Status": "Not Matched",
-                        "Reference": None,
-                        "Verse Text": None
-                    })
-
-            # Convert results into DataFrame
-            output_df = pd.DataFrame(results)
-
-            # Move Not Matched rows to the top
-            output_df = pd.concat([
-                output_df[output_df["Match Status"] == "Not Matched"],
-                output_df[output_df["Match Status"] == "Matched"]
-            ])
-
-            # Save results in the same folder as input TXT files
-            output_name = os.path.splitext(txt_file)[0] + "_results.xlsx"
-            output_path = os.path.join(txt_folder, output_name)
-            output_df.to_excel(output_path, index=False)
+    df = read_excel_cached(excel_file)
+
+    # Vectorised normalize_text: with pyarrow, the normalisation below and the
+    # per-line contains() run as Arrow compute kernels over contiguous UTF-8 buffers.
+    # Non-text cells become "" first, as normalize_text does, rather than their str()
+    verse_text = df["Verse Text"]
+    verse_text = verse_text.where(verse_text.map(lambda value: isinstance(value, str)), "")
+    normalized = verse_text.astype(STRING_DTYPE).str.strip()
+    for curly, straight in QUOTE_PAIRS:
+        normalized = normalized.str.replace(curly, straight, regex=False)
+    df["Normalized"] = normalized
 
+    txt_files = [f for f in os.listdir(txt_folder) if f.endswith(".txt")]
+    txt_paths = [os.path.join(txt_folder, f) for f in txt_files]
+
+    # TXT files are independent, so match them in parallel against the same reference frame
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        output_paths = executor.map(partial(process_txt_file, df=df), txt_paths)
+        for txt_file, output_path in zip(txt_files, output_paths):
             print(f"Results for {txt_file} saved to {output_path}")
 
 
-# Example usage
-process_txt_files(
-    txt_folder=".",  
-    excel_file="01-Genesis_filtered_verses.xlsx"
-)
+if __name__ == "__main__":
+    # Example usage
+    process_txt_files(
+        txt_folder=".",
+        excel_file="01-Genesis_filtered_verses.xlsx"
+    )
@@ -1,163 +1,91 @@
-import openpyxl
 import fitz  # PyMuPDF
+import csv
 import logging
 import sys
 import os
-import glob
-from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# ===================== LOGGING =====================
-def setup_logging():
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f'logs/pdf_margin_annotator_{timestamp}.log'
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    
-    logging.info(f"=== PDF Margin Annotator Started ===")
-    logging.info(f"Log file: {log_filename}")
-    return log_filename
+from annotator_common import (SHEET_NS, flush_logs, get_from_position, get_reference_value, init_worker,
+                              is_bottom_measurement, read_sheet, setup_logging)
 
 # ===================== CONFIG =====================
 reference_file = "margin_baseline_reference.txt"
+INCH_TO_PTS = 72
 
 # ===================== FILE PAIRS =====================
 def find_pdf_excel_pairs():
-    pdf_files = glob.glob("*.pdf")
+    # One directory pass; scandir's dirent data answers "is there an .xlsx?" without a stat per PDF
+    with os.scandir('.') as it:
+        entries = {e.name: e for e in it if not e.name.startswith('.') and e.is_file()}
     pairs = []
     
-    for pdf_file in pdf_files:
+    for pdf_file in entries:
+        if not pdf_file.endswith(".pdf"):
+            continue
         base_name = os.path.splitext(pdf_file)[0]
         excel_file = f"{base_name}.xlsx"
-        if os.path.exists(excel_file):
+        if excel_file in entries:
             output_pdf = f"{base_name}_annotated.pdf"
             pairs.append({'pdf': pdf_file, 'excel': excel_file, 'output': output_pdf, 'base_name': base_name})
-            logging.info(f"Found pair: {pdf_file} + {excel_file} -> {output_pdf}")
+            logging.info("Found pair: %s + %s -> %s", pdf_file, excel_file, output_pdf)
         else:
-            logging.warning(f"PDF found but no matching Excel file: {pdf_file} (looking for {excel_file})")
+            logging.warning("PDF found but no matching Excel file: %s (looking for %s)", pdf_file, excel_file)
     
     return pairs
 
 # ===================== REFERENCE VALUES =====================
 def load_reference_values(ref_file_path):
-    logging.info(f"Loading reference values from: {ref_file_path}")
+    logging.info("Loading reference values from: %s", ref_file_path)
     ref_values = {}
     
     try:
-        with open(ref_file_path, 'r') as f:
-            lines = f.readlines()
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if ':' in line:
-                key, value = line.split(':', 1)
+        # csv.reader does the ':' splitting in C; QUOTE_NONE keeps quotes literal like str.split did
+        with open(ref_file_path, 'r', newline='') as f:
+            reader = csv.reader(f, delimiter=':', quoting=csv.QUOTE_NONE)
+            for row in reader:
+                if len(row) < 2:
+                    continue
+                value = ':'.join(row[1:]).strip()
                 try:
-                    ref_values[key.strip()] = float(value.strip())
+                    ref_values[row[0].strip()] = float(value)
                 except ValueError:
-                    logging.warning(f"Line {line_num}: Could not parse '{value.strip()}'")
-        logging.info(f"Loaded {len(ref_values)} reference values")
+                    logging.warning("Line %s: Could not parse '%s'", reader.line_num, value)
+        logging.info("Loaded %s reference values", len(ref_values))
         return ref_values
     except FileNotFoundError:
-        logging.error(f"Reference file '{ref_file_path}' not found")
+        logging.error("Reference file '%s' not found", ref_file_path)
         sys.exit(1)
 
-def get_reference_value(column_name, page_side, ref_values):
-    column_mappings = {
-        "Top Scripture Baseline Left (in)": "Top",
-        "Top Scripture Baseline Right (in)": "Top",
-        "Bottom Scripture Baseline Left (in)": "Bottom",
-        "Bottom Scripture Baseline Right (in)": "Bottom",
-        "Footnote Baseline (in)": "Footnote",
-        "Book Intro Baseline (in)": "Book Intro",
-        "Study Note Baseline (in)": "Study Note",
-        "Article Baseline (in)": "Article",
-        "Running Head Baseline (in)": "Running Head",
-        "Page Number Baseline (in)": "Page Number",
-        "Column 1 Max Width (in)": "Column 1 Max Width (in)",
-        "Column 2 Max Width (in)": "Column 2 Max Width (in)",
-        "Column Gap Width (in)": "Column Gap Width (in)",
-        "Box Baseline (in)": "Box Baseline"
-    }
-    page_side_mappings = {
-        "Column 1 Left Edge (in)": f"{page_side} Pages - Column 1 Left Edge (in)",
-        "Column 1 Right Edge (in)": f"{page_side} Pages - Column 1 Right Edge (in)", 
-        "Column 2 Left Edge (in)": f"{page_side} Pages - Column 2 Left Edge (in)",
-        "Column 2 Right Edge (in)": f"{page_side} Pages - Column 2 Right Edge (in)"
-    }
-    
-    if column_name in page_side_mappings:
-        ref_key = page_side_mappings[column_name]
-        return ref_values.get(ref_key, None)
-    if column_name in column_mappings:
-        ref_key = column_mappings[column_name]
-        return ref_values.get(ref_key, None)
-    return None
-
-# ===================== MEASUREMENT TYPES =====================
-def is_bottom_measurement(column_name):
-    bottom_measurements = {
-        "Bottom Scripture Baseline Left (in)",
-        "Bottom Scripture Baseline Right (in)",
-        "Bottom Scripture Baseline Column 1 (in)",
-        "Bottom Scripture Baseline Column 2 (in)",
-        "Footnote Baseline (in)",
-        "Book Intro Baseline (in)",
-        "Study Note Baseline (in)",
-        "Article Baseline (in)",
-        "Box Baseline (in)"
-    }
-    return column_name in bottom_measurements
-
-def is_side_measurement(column_name):
-    side_measurements = {
-        "Column 1 Left Edge (in)",
-        "Column 1 Right Edge (in)",
-        "Column 2 Left Edge (in)", 
-        "Column 2 Right Edge (in)",
-        "Column 1 Max Width (in)",
-        "Column 2 Max Width (in)",
-        "Column Gap Width (in)"
-    }
-    return column_name in side_measurements
-
 # ===================== COMMENT TEXT =====================
-def create_comment_text(column_name, actual_value, reference_value, color_type):
-    if is_bottom_measurement(column_name):
-        from_position = "from the bottom"
-    elif is_side_measurement(column_name):
-        from_position = "from the side"
-    else:
-        from_position = "from the top"
-    
-    comment = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. Normally text is {reference_value}"
-    return comment
+def create_comment_text(column_name, actual_value, reference_value, color_type, from_position):
+    if reference_value is None:
+        return f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. No reference available"
+    return f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. Normally text is {reference_value}"
 
 # ===================== COLOR DETECTION =====================
-COLOR_HEX_MAP = {
-    "FFFF0000": "RED",
-    "FFFFFF00": "YELLOW",
-    "FF800080": "PURPLE",
-    "FFFFA500": "ORANGE"
+# ARGB fill colors keyed by int, so hex case never matters and no uppercased copy is made
+COLOR_HEX_INTS = {
+    0xFFFF0000: "RED",
+    0xFFFFFF00: "YELLOW",
+    0xFF800080: "PURPLE",
+    0xFFFFA500: "ORANGE"
 }
 
-def get_cell_color(cell):
+def get_fill_color(pattern_fill):
+    """Map a <patternFill> element from styles.xml to one of the annotated colors"""
+    if pattern_fill is None or pattern_fill.get("patternType") != "solid":
+        return None
+    fg_color = pattern_fill.find(f"{SHEET_NS}fgColor")
+    if fg_color is None:
+        return None
+    rgb = fg_color.get("rgb")
+    if rgb is None:
+        return None
     try:
-        if cell.fill.patternType != 'solid':
-            return None
-        rgb = cell.fill.start_color.rgb
-        if rgb is None:
-            return None
-        return COLOR_HEX_MAP.get(rgb.upper())
-    except:
+        return COLOR_HEX_INTS.get(int(rgb, 16))
+    except ValueError:
         return None
 
 # ===================== ANNOTATION COUNT VERIFICATION =====================
@@ -196,129 +124,169 @@ def add_verification_note(doc, expected_counts, actual_counts):
     # Create the annotation
     annot = first_page.add_text_annot(position, summary_text)
     annot.set_info(title="Annotation Verification")
-    annot.set_colors(stroke=[0, 0, 0], fill=[1, 1, 0.9])  # Light yellow background with black border
+    annot.set_colors(stroke=[0, 0, 0])  # Black icon; text annotations have no fill color
     annot.update()
 
 # ===================== PROCESSING =====================
+# Sticky-note stroke color per flagged color; text annotations have no fill color
+_ANNOT_COLORS = {
+    "red": [1, 0, 0],
+    "yellow": [1, 1, 0],
+    "orange": [1, 0.6, 0],
+    "purple": [0.5, 0, 0.5],
+}
+
+# One prepared margin note, stored as a tuple rather than a dict per entry
+PagedComment = namedtuple("PagedComment", "page_num y_inch comment color is_bottom column_idx")
+
 def process_file_pair(file_pair, ref_values):
     excel_file = file_pair['excel']
     pdf_file = file_pair['pdf']
     output_pdf = file_pair['output']
     base_name = file_pair['base_name']
     
-    logging.info(f"=== Processing {base_name} ===")
-    
-    inch_to_pts = 72
+    logging.info("=== Processing %s ===", base_name)
     
     try:
-        wb = openpyxl.load_workbook(excel_file)
-        ws = wb.active
+        colored_styles, sheet_rows = read_sheet(excel_file, get_fill_color)
     except Exception as e:
-        logging.error(f"Error loading Excel {excel_file}: {e}")
+        logging.error("Error loading Excel %s: %s", excel_file, e)
         return False
     
-    headers = {col: ws.cell(row=1, column=col).value for col in range(1, ws.max_column + 1) if ws.cell(row=1, column=col).value}
+    # Only (column, side) pairs vary, so each reference is looked up once per file
+    @lru_cache(maxsize=None)
+    def _ref(column_name, page_side):
+        return get_reference_value(column_name, page_side, ref_values)
     
+    def classify_column(column_name):
+        # Which text column the header names decides the annotation's x position
+        column_pos = 1 if "Column 1" in column_name else 2 if "Column 2" in column_name else 0
+        return (column_name, is_bottom_measurement(column_name), get_from_position(column_name), column_pos)
+    
+    headers = {}
+    # Per-column (name, is_bottom, from_position, column_idx), derived once instead of per cell
+    col_meta = {}
     paged_comments = []
     expected_color_counts = defaultdict(int)
     
-    for row_num, row in enumerate(ws.iter_rows(min_row=2), start=2):
-        try:
-            page_num = int(row[0].value)
-            page_side = row[1].value
-        except:
+    # Per-cell method lookups bound once for the row loop
+    style_color = colored_styles.get
+    add_comment = paged_comments.append
+    
+    for row_num, cells in sheet_rows:
+        if row_num == 1:
+            headers = {col: value for col, (value, style_id) in cells.items() if value}
+            for col_idx, column_name in headers.items():
+                if col_idx >= 3:
+                    col_meta[col_idx] = classify_column(column_name)
             continue
+        # Blank rows are common, so test for them before paying for a failed int()
+        page_value = cells.get(1, (None, 0))[0]
+        if page_value is None:
+            continue
+        # Page numbers are stored as ints; only anything else needs a checked int()
+        if type(page_value) is int:
+            page_num = page_value
+        else:
+            try:
+                page_num = int(page_value)
+            except (ValueError, TypeError):
+                continue
+        page_side = cells.get(2, (None, 0))[0]
         
-        for col_idx, cell in enumerate(row[2:], start=3):
-            if cell.value is None or cell.value == "N/A":
+        for col_idx, (actual_value, style_id) in cells.items():
+            color_type = style_color(style_id)
+            if color_type is None or col_idx < 3:
                 continue
-            
-            column_name = headers.get(col_idx, f"Column {col_idx}")
-            color_type = get_cell_color(cell)
-            if color_type is None:
+            if actual_value is None or actual_value == "N/A":
                 continue
             
             # Count expected annotations by color
             expected_color_counts[color_type] += 1
             
-            actual_value = cell.value
-            reference_value = get_reference_value(column_name, page_side, ref_values)
-            
-            if reference_value is not None:
-                comment_text = create_comment_text(column_name, actual_value, reference_value, color_type)
-            else:
-                from_position = "from the bottom" if is_bottom_measurement(column_name) else "from the side" if is_side_measurement(column_name) else "from the top"
-                comment_text = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. No reference available"
+            meta = col_meta.get(col_idx)
+            if meta is None:
+                # Column without a header; still annotated, named by its number
+                meta = col_meta[col_idx] = classify_column(f"Column {col_idx}")
+            column_name, is_bottom, from_position, column_pos = meta
+            reference_value = _ref(column_name, page_side)
+            comment_text = create_comment_text(column_name, actual_value, reference_value, color_type, from_position)
             
-            paged_comments.append({
-                "page_num": page_num,
-                "y_inch": actual_value,
-                "comment": comment_text,
-                "color": color_type.lower(),
-                "is_bottom": is_bottom_measurement(column_name)
-            })
+            add_comment(PagedComment(page_num, actual_value, comment_text, color_type.lower(), is_bottom, column_pos))
     
-    logging.info(f"Total annotations prepared: {len(paged_comments)}")
-    logging.info(f"Expected color counts: {dict(expected_color_counts)}")
+    logging.info("Total annotations prepared: %s", len(paged_comments))
+    logging.info("Expected color counts: %s", dict(expected_color_counts))
     
     try:
         doc = fitz.open(pdf_file)
     except Exception as e:
-        logging.error(f"Error opening PDF {pdf_file}: {e}")
+        logging.error("Error opening PDF %s: %s", pdf_file, e)
         return False
     
     actual_color_counts = defaultdict(int)
     
+    # Fetch each page once and add all of its annotations together
+    comments_by_page = defaultdict(list)
     for entry in paged_comments:
-        if entry["page_num"] < 1 or entry["page_num"] > len(doc):
+        comments_by_page[entry.page_num].append(entry)
+    
+    for page_num, entries in comments_by_page.items():
+        if page_num < 1 or page_num > len(doc):
             continue
-        page = doc[entry["page_num"] - 1]
-        page_height = page.rect.height
-        
-        x_pts = page.rect.width / 2
-        if "Column 1" in entry["comment"]:
-            x_pts = page.rect.width / 4
-        elif "Column 2" in entry["comment"]:
-            x_pts = 3 * page.rect.width / 4
-        
-        y_pts_pdf = page_height - (entry["y_inch"] * inch_to_pts) if entry["is_bottom"] else entry["y_inch"] * inch_to_pts
-        y_pts_pdf = max(0, min(y_pts_pdf, page_height))
-        
-        annot = page.add_text_annot((x_pts, y_pts_pdf), entry["comment"])
-        annot.set_info(title="Margin Check")
+        page = doc[page_num - 1]
+        page_rect = page.rect
+        page_width = page_rect.width
+        page_height = page_rect.height
+        # Page middle, or the center of column 1 / column 2
+        column_x = (page_width * 0.5, page_width * 0.25, page_width * 0.75)
         
-        # Count actual annotations by color
-        actual_color_counts[entry["color"].upper()] += 1
-        
-        # Set colors
-        if entry["color"] == "red":
-            annot.set_colors(stroke=[1, 0, 0], fill=[1, 0.8, 0.8])
-        elif entry["color"] == "yellow":
-            annot.set_colors(stroke=[1, 1, 0], fill=[1, 1, 0.8])
-        elif entry["color"] == "orange":
-            annot.set_colors(stroke=[1, 0.6, 0], fill=[1, 0.9, 0.7])
-        elif entry["color"] == "purple":
-            annot.set_colors(stroke=[0.5, 0, 0.5], fill=[0.8, 0.7, 1])
-        annot.update()
+        for _, y_inch, comment, color, is_bottom, column_idx in entries:
+            x_pts = column_x[column_idx]
+            
+            y_pts = y_inch * INCH_TO_PTS
+            y_pts_pdf = page_height - y_pts if is_bottom else y_pts
+            y_pts_pdf = max(0, min(y_pts_pdf, page_height))
+            
+            annot = page.add_text_annot((x_pts, y_pts_pdf), comment)
+            annot.set_info(title="Margin Check")
+            
+            # Count actual annotations by color
+            actual_color_counts[color.upper()] += 1
+            
+            # Set colors
+            stroke = _ANNOT_COLORS.get(color)
+            if stroke is not None:
+                annot.set_colors(stroke=stroke)
+            annot.update()
     
     # Add verification note to first page
     add_verification_note(doc, expected_color_counts, actual_color_counts)
     
     try:
-        doc.save(output_pdf, incremental=False, garbage=4)
+        # One compressed write at the end; annot.update() stays per annotation since it builds the colored appearance.
+        # Annotations only add objects, so the full garbage=4 compaction is skipped (it roughly doubled save time)
+        doc.save(output_pdf, incremental=False, garbage=0, deflate=True)
         doc.close()
-        logging.info(f"Saved annotated PDF: {output_pdf}")
-        logging.info(f"Actual color counts: {dict(actual_color_counts)}")
+        logging.info("Saved annotated PDF: %s", output_pdf)
+        logging.info("Actual color counts: %s", dict(actual_color_counts))
     except Exception as e:
-        logging.error(f"Error saving PDF {output_pdf}: {e}")
+        logging.error("Error saving PDF %s: %s", output_pdf, e)
         return False
     
-    logging.info(f"=== {base_name} Complete: {len(paged_comments)} annotations added ===")
+    logging.info("=== %s Complete: %s annotations added ===", base_name, len(paged_comments))
     return True
 
 # ===================== MAIN =====================
+def process_file_pair_worker(file_pair, ref_values):
+    """Run process_file_pair in a pool worker and flush its buffered log before returning"""
+    try:
+        return process_file_pair(file_pair, ref_values)
+    finally:
+        flush_logs()
+
 def main():
-    setup_logging()
+    # Progress and per-pair results are printed as they happen, as before the shared setup
+    log_filename = setup_logging(console_level=logging.INFO)
     ref_values = load_reference_values(reference_file)
     file_pairs = find_pdf_excel_pairs()
     
@@ -327,14 +295,25 @@ def main():
         sys.exit(1)
     
     total_processed, total_failed = 0, 0
-    for pair in file_pairs:
-        success = process_file_pair(pair, ref_values)
-        if success:
-            total_processed += 1
-            print(f"✓ Successfully processed: {pair['base_name']}")
-        else:
-            total_failed += 1
-            print(f"✗ Failed to process: {pair['base_name']}")
+    # Pairs share nothing but the read-only reference dict, so each gets its own process
+    workers = min(len(file_pairs), os.cpu_count() or 1)
+    # Workers get their own log files only when there is a main log file to name them after
+    initializer, initargs = (init_worker, (log_filename, logging.INFO)) if log_filename else (None, ())
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        futures = {executor.submit(process_file_pair_worker, pair, ref_values): pair for pair in file_pairs}
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                success = future.result()
+            except Exception as e:
+                logging.error("Worker failed on %s: %s", pair['base_name'], e)
+                success = False
+            if success:
+                total_processed += 1
+                print(f"✓ Successfully processed: {pair['base_name']}")
+            else:
+                total_failed += 1
+                print(f"✗ Failed to process: {pair['base_name']}")
     
     print(f"\n=== BATCH COMPLETE ===")
     print(f"Successfully processed: {total_processed}")
@@ -1,46 +1,42 @@
-import openpyxl
 import fitz  # PyMuPDF
 import logging
 import sys
 import os
-import glob
-from datetime import datetime
+import shutil
+import argparse
+import multiprocessing
+from functools import partial
+from operator import itemgetter
+from collections import namedtuple
 
-# Configure logging
-def setup_logging():
-    """Set up detailed logging for troubleshooting."""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f'logs/pdf_margin_annotator_{timestamp}.log'
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    
-    logging.info(f"=== PDF Margin Annotator Started ===")
-    logging.info(f"Log file: {log_filename}")
-    return log_filename
+from annotator_common import SHEET_NS, flush_logs, init_worker, read_sheet, setup_logging
 
 # === CONFIG ===
 reference_file = "margin_baseline_reference.txt"
+INCH_TO_PTS = 72
+
+# Marks a reference-cache miss, since None is a valid cached result
+_MISSING = object()
 
 def find_pdf_excel_pairs():
     """Find all PDF files and their corresponding Excel files in the current directory."""
-    pdf_files = glob.glob("*.pdf")
+    # One scandir pass buckets files by stem, so pairing needs no further stat calls
+    files_by_stem = {}
+    with os.scandir('.') as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            stem, ext = os.path.splitext(entry.name)
+            files_by_stem.setdefault(stem, {})[ext.lower()] = entry.name
     pairs = []
     
-    for pdf_file in pdf_files:
-        base_name = os.path.splitext(pdf_file)[0]
-        excel_file = f"{base_name}.xlsx"
+    for base_name, files in files_by_stem.items():
+        pdf_file = files.get('.pdf')
+        if pdf_file is None:
+            continue
+        excel_file = files.get('.xlsx', f"{base_name}.xlsx")
         
-        if os.path.exists(excel_file):
+        if '.xlsx' in files:
             output_pdf = f"{base_name}_annotated.pdf"
             pairs.append({
                 'pdf': pdf_file,
@@ -48,126 +44,134 @@ def find_pdf_excel_pairs():
                 'output': output_pdf,
                 'base_name': base_name
             })
-            logging.info(f"Found pair: {pdf_file} + {excel_file} -> {output_pdf}")
+            logging.info("Found pair: %s + %s -> %s", pdf_file, excel_file, output_pdf)
         else:
-            logging.warning(f"PDF found but no matching Excel file: {pdf_file} (looking for {excel_file})")
+            logging.warning("PDF found but no matching Excel file: %s (looking for %s)", pdf_file, excel_file)
     
     return pairs
 
 def load_reference_values(ref_file_path):
     """Load reference values from the margin baseline reference file."""
-    logging.info(f"Loading reference values from: {ref_file_path}")
+    logging.info("Loading reference values from: %s", ref_file_path)
     ref_values = {}
     
     try:
         with open(ref_file_path, 'r') as f:
-            lines = f.readlines()
+            text = f.read()
         
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if ':' in line:
-                key, value = line.split(':', 1)
-                try:
-                    parsed_value = float(value.strip())
-                    ref_values[key.strip()] = parsed_value
-                    logging.debug(f"Line {line_num}: '{key.strip()}' = {parsed_value}")
-                except ValueError:
-                    logging.warning(f"Line {line_num}: Could not parse value '{value.strip()}' as float")
-                    continue
+        for line_num, line in enumerate(text.splitlines(), 1):
+            key, sep, value = line.partition(':')
+            if not sep:
+                continue
+            value = value.strip()
+            try:
+                ref_values[key.strip()] = float(value)
+            except ValueError:
+                logging.warning("Line %d: Could not parse value '%s' as float", line_num, value)
                 
-        logging.info(f"Successfully loaded {len(ref_values)} reference values")
+        logging.info("Successfully loaded %s reference values", len(ref_values))
         return ref_values
         
     except FileNotFoundError:
-        logging.error(f"Reference file '{ref_file_path}' not found")
+        logging.error("Reference file '%s' not found", ref_file_path)
         sys.exit(1)
     except Exception as e:
-        logging.error(f"Error reading reference file: {e}")
+        logging.error("Error reading reference file: %s", e)
         sys.exit(1)
 
+# Mapping from Excel column names to reference keys
+_COLUMN_MAPPINGS = {
+    "Top Scripture Baseline Column 1 (in)": "Top",
+    "Top Scripture Baseline Column 2 (in)": "Top",
+    "Bottom Scripture Baseline Column 1 (in)": "Bottom",
+    "Bottom Scripture Baseline Column 2 (in)": "Bottom",
+    "Footnote Baseline (in)": "Footnote",
+    "Book Intro Baseline (in)": "Book Intro",
+    "Study Note Baseline (in)": "Study Note",
+    "Article Baseline (in)": "Article",
+    "Running Head Baseline (in)": "Running Head",
+    "Page Number Baseline (in)": "Page Number",
+    "Column 1 Max Width (in)": "Column 1 Max Width (in)",
+    "Column 2 Max Width (in)": "Column 2 Max Width (in)",
+    "Column Gap Width (in)": "Column Gap Width (in)",
+    "Box Baseline (in)": "Box Baseline",
+    "Subhead Baseline (in)": "Subhead Baseline (in)"
+}
+
+# Page-side dependent columns; {page_side} is filled in per lookup
+_PAGE_SIDE_MAPPINGS_TEMPLATE = {
+    "Column 1 Left Edge (in)": "{page_side} Pages - Column 1 Left Edge (in)",
+    "Column 1 Right Edge (in)": "{page_side} Pages - Column 1 Right Edge (in)",
+    "Column 2 Left Edge (in)": "{page_side} Pages - Column 2 Left Edge (in)",
+    "Column 2 Right Edge (in)": "{page_side} Pages - Column 2 Right Edge (in)"
+}
+
 def get_reference_value(column_name, page_side, ref_values):
     """Get the appropriate reference value based on column name and page side."""
-    logging.debug(f"Getting reference value for column '{column_name}' on {page_side} page")
-    
-    # Define the mapping from Excel column names to reference keys
-    column_mappings = {
-        "Top Scripture Baseline Column 1 (in)": "Top",
-        "Top Scripture Baseline Column 2 (in)": "Top",
-        "Bottom Scripture Baseline Column 1 (in)": "Bottom",
-        "Bottom Scripture Baseline Column 2 (in)": "Bottom",
-        "Footnote Baseline (in)": "Footnote",
-        "Book Intro Baseline (in)": "Book Intro",
-        "Study Note Baseline (in)": "Study Note",
-        "Article Baseline (in)": "Article",
-        "Running Head Baseline (in)": "Running Head",
-        "Page Number Baseline (in)": "Page Number",
-        "Column 1 Max Width (in)": "Column 1 Max Width (in)",
-        "Column 2 Max Width (in)": "Column 2 Max Width (in)",
-        "Column Gap Width (in)": "Column Gap Width (in)",
-        "Box Baseline (in)": "Box Baseline",
-        "Subhead Baseline (in)": "Subhead Baseline (in)"
-    }
-    
-    # Handle page-side dependent columns
-    page_side_mappings = {
-        "Column 1 Left Edge (in)": f"{page_side} Pages - Column 1 Left Edge (in)",
-        "Column 1 Right Edge (in)": f"{page_side} Pages - Column 1 Right Edge (in)", 
-        "Column 2 Left Edge (in)": f"{page_side} Pages - Column 2 Left Edge (in)",
-        "Column 2 Right Edge (in)": f"{page_side} Pages - Column 2 Right Edge (in)"
-    }
+    logging.debug("Getting reference value for column '%s' on %s page", column_name, page_side)
     
     # First try page-side dependent mapping
-    if column_name in page_side_mappings:
-        ref_key = page_side_mappings[column_name]
-        logging.debug(f"Using page-side dependent mapping: '{column_name}' -> '{ref_key}'")
+    if column_name in _PAGE_SIDE_MAPPINGS_TEMPLATE:
+        ref_key = _PAGE_SIDE_MAPPINGS_TEMPLATE[column_name].format(page_side=page_side)
+        logging.debug("Using page-side dependent mapping: '%s' -> '%s'", column_name, ref_key)
         ref_value = ref_values.get(ref_key)
         if ref_value is not None:
-            logging.debug(f"Found reference value: {ref_value}")
+            logging.debug("Found reference value: %s", ref_value)
             return ref_value
         else:
-            logging.warning(f"Page-side dependent reference key '{ref_key}' not found in reference values")
+            logging.warning("Page-side dependent reference key '%s' not found in reference values", ref_key)
     
     # Then try regular mapping
-    if column_name in column_mappings:
-        ref_key = column_mappings[column_name]
-        logging.debug(f"Using regular mapping: '{column_name}' -> '{ref_key}'")
+    if column_name in _COLUMN_MAPPINGS:
+        ref_key = _COLUMN_MAPPINGS[column_name]
+        logging.debug("Using regular mapping: '%s' -> '%s'", column_name, ref_key)
         ref_value = ref_values.get(ref_key)
         if ref_value is not None:
-            logging.debug(f"Found reference value: {ref_value}")
+            logging.debug("Found reference value: %s", ref_value)
             return ref_value
         else:
-            logging.warning(f"Regular reference key '{ref_key}' not found in reference values")
+            logging.warning("Regular reference key '%s' not found in reference values", ref_key)
     
-    logging.warning(f"No mapping found for column '{column_name}'")
+    logging.warning("No mapping found for column '%s'", column_name)
     return None
 
+_BOTTOM_MEASUREMENTS = frozenset({
+    "Bottom Scripture Baseline Column 1 (in)",
+    "Bottom Scripture Baseline Column 2 (in)",
+    "Footnote Baseline (in)",
+    "Book Intro Baseline (in)",
+    "Study Note Baseline (in)",
+    "Article Baseline (in)",
+    "Box Baseline (in)"
+})
+
 def is_bottom_measurement(column_name):
     """Check if a measurement is taken from the bottom of the page."""
-    bottom_measurements = {
-        "Bottom Scripture Baseline Column 1 (in)",
-        "Bottom Scripture Baseline Column 2 (in)",
-        "Footnote Baseline (in)",
-        "Book Intro Baseline (in)",
-        "Study Note Baseline (in)",
-        "Article Baseline (in)",
-        "Box Baseline (in)"
-    }
-    return column_name in bottom_measurements
+    return column_name in _BOTTOM_MEASUREMENTS
+
+_SIDE_MEASUREMENTS = frozenset({
+    "Column 1 Left Edge (in)",
+    "Column 1 Right Edge (in)",
+    "Column 2 Left Edge (in)",
+    "Column 2 Right Edge (in)",
+    "Column 1 Max Width (in)",
+    "Column 2 Max Width (in)",
+    "Column Gap Width (in)"
+})
 
 def is_side_measurement(column_name):
     """Check if a measurement is taken from the side of the page."""
-    side_measurements = {
-        "Column 1 Left Edge (in)",
-        "Column 1 Right Edge (in)",
-        "Column 2 Left Edge (in)", 
-        "Column 2 Right Edge (in)",
-        "Column 1 Max Width (in)",
-        "Column 2 Max Width (in)",
-        "Column Gap Width (in)"
-    }
-    return column_name in side_measurements
+    return column_name in _SIDE_MEASUREMENTS
 
-def create_comment_text(column_name, actual_value, reference_value, color_type):
+def get_from_position(column_name):
+    """Describe which page edge a column's measurement is taken from."""
+    if is_bottom_measurement(column_name):
+        return "from the bottom"
+    elif is_side_measurement(column_name):
+        return "from the side"
+    return "from the top"
+
+def create_comment_text(column_name, actual_value, reference_value, color_type, from_position=None):
     """Create the comment text for the sticky note."""
     # Handle purple and orange specific text
     if color_type == "PURPLE":
@@ -176,69 +180,36 @@ def create_comment_text(column_name, actual_value, reference_value, color_type):
         return "This column is not aligned with the other column. The other column is in the correct position."
     
     # Original logic for red and yellow
-    if is_bottom_measurement(column_name):
-        from_position = "from the bottom"
-    elif is_side_measurement(column_name):
-        from_position = "from the side"
-    else:
-        from_position = "from the top"
+    if from_position is None:
+        from_position = get_from_position(column_name)
     
     if reference_value is not None:
         comment = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. Normally text is {reference_value}"
     else:
         comment = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. No reference available"
     
-    logging.debug(f"Created comment: '{comment}'")
+    logging.debug("Created comment: '%s'", comment)
     return comment
 
 # === COLOR DETECTION ===
-def is_red(cell):
-    """Check if a cell is filled with red color."""
-    try:
-        if cell.fill and cell.fill.fgColor and cell.fill.fgColor.rgb:
-            return cell.fill.fgColor.rgb.upper().endswith("FFC7CE")
-        return False
-    except:
-        return False
-
-def is_yellow(cell):
-    """Check if a cell is filled with yellow color."""
-    try:
-        if cell.fill and cell.fill.fgColor and cell.fill.fgColor.rgb:
-            return cell.fill.fgColor.rgb.upper().endswith("FFEB9C")
-        return False
-    except:
-        return False
-
-def is_purple(cell):
-    """Check if a cell is filled with purple color."""
-    try:
-        if cell.fill and cell.fill.fgColor and cell.fill.fgColor.rgb:
-            return cell.fill.fgColor.rgb.upper().endswith("E4DFEC")
-        return False
-    except:
-        return False
-
-def is_orange(cell):
-    """Check if a cell is filled with orange color."""
-    try:
-        if cell.fill and cell.fill.fgColor and cell.fill.fgColor.rgb:
-            return cell.fill.fgColor.rgb.upper().endswith("FDEADA")
-        return False
-    except:
-        return False
+# Last six hex digits of the fill RGB -> color type
+_COLOR_LUT = {
+    "FFC7CE": "RED",
+    "FFEB9C": "YELLOW",
+    "E4DFEC": "PURPLE",
+    "FDEADA": "ORANGE",
+}
 
-def get_cell_color(cell):
-    """Determine the color of a cell and return the color type as string."""
-    if is_red(cell):
-        return "RED"
-    elif is_yellow(cell):
-        return "YELLOW"
-    elif is_purple(cell):
-        return "PURPLE"
-    elif is_orange(cell):
-        return "ORANGE"
-    return None
+def get_fill_color(pattern_fill):
+    """Return the color type for a <patternFill> element, or None if it is not one of the flagged colors."""
+    if pattern_fill is None:
+        return None
+    fg_color = pattern_fill.find(f"{SHEET_NS}fgColor")
+    # Theme/indexed colors carry no RGB value
+    rgb = fg_color.get("rgb") if fg_color is not None else None
+    if not rgb:
+        return None
+    return _COLOR_LUT.get(rgb[-6:].upper())
 
 def add_summary_annotation(doc, color_counts, added_color_counts):
     """Add a summary annotation to the first page showing the comparison results."""
@@ -272,123 +243,158 @@ def add_summary_annotation(doc, color_counts, added_color_counts):
         annot.set_info(title="Annotation Summary")
         annot.update()
         
-        logging.info(f"Added summary annotation to first page: {summary_text}")
+        logging.info("Added summary annotation to first page: %s", summary_text)
         return True
         
     except Exception as e:
-        logging.error(f"Error adding summary annotation: {e}")
+        logging.error("Error adding summary annotation: %s", e)
         return False
 
+# Sticky-note stroke color per flagged color; text annotations have no fill color
+_ANNOT_COLORS = {
+    "red": [1, 0, 0],
+    "yellow": [1, 1, 0],
+    "orange": [1, 0.6, 0],
+    "purple": [0.5, 0, 0.5],
+}
+
+# One prepared margin note; a tuple per entry instead of a dict
+PagedComment = namedtuple("PagedComment", "page_num y_inch comment color x_fraction is_bottom")
+
 # ===================== PROCESSING =====================
-def process_file_pair(file_pair, ref_values):
+def process_file_pair(file_pair, ref_values, incremental=False, compact=False):
     excel_file = file_pair['excel']
     pdf_file = file_pair['pdf']
     output_pdf = file_pair['output']
     base_name = file_pair['base_name']
     
-    logging.info(f"=== Processing {base_name} ===")
-    
-    inch_to_pts = 72
+    logging.info("=== Processing %s ===", base_name)
     
     try:
-        wb = openpyxl.load_workbook(excel_file)
-        ws = wb.active
+        # Styles are classified once up front; the sheet itself is streamed row by row
+        colored_styles, sheet_rows = read_sheet(excel_file, get_fill_color)
     except Exception as e:
-        logging.error(f"Error loading Excel {excel_file}: {e}")
+        logging.error("Error loading Excel %s: %s", excel_file, e)
         return False
     
-    headers = {col: ws.cell(row=1, column=col).value for col in range(1, ws.max_column + 1) if ws.cell(row=1, column=col).value}
+    headers = {}
+    # Per-column facts the comment text and placement need, worked out once per column
+    column_meta = {}
     
     paged_comments = []
     
+    # Reference values depend only on (column, page side); resolve each pair once
+    # so repeated misses don't re-log the same warnings for every cell
+    ref_cache = {}
+    
     # Track color counts in Excel
     excel_color_counts = {"red": 0, "yellow": 0, "orange": 0, "purple": 0}
     
-    for row_num, row in enumerate(ws.iter_rows(min_row=2), start=2):
-        try:
-            page_num = int(row[0].value)
-            page_side = row[1].value
-        except:
+    style_color = colored_styles.get
+    
+    for row_num, cells in sheet_rows:
+        if row_num == 1:
+            headers = {col: value for col, (value, style_id) in cells.items() if value}
+            continue
+        # Blank rows are common, so test for them before paying for a failed int()
+        page_value = cells[1][0] if 1 in cells else None
+        if page_value is None:
             continue
+        # Page numbers are stored as ints; only anything else needs a checked int()
+        if type(page_value) is int:
+            page_num = page_value
+        else:
+            try:
+                page_num = int(page_value)
+            except (ValueError, TypeError):
+                continue
+        page_side = cells[2][0] if 2 in cells else None
         
-        for col_idx, cell in enumerate(row[2:], start=3):
-            if cell.value is None or cell.value == "N/A":
+        for col_idx, (actual_value, style_id) in cells.items():
+            # Most cells are unfilled, so the style lookup is the cheapest first filter
+            color_type = style_color(style_id)
+            if color_type is None or col_idx < 3:
                 continue
-            
-            column_name = headers.get(col_idx, f"Column {col_idx}")
-            color_type = get_cell_color(cell)
-            if color_type is None:
+            if actual_value is None or actual_value == "N/A":
                 continue
             
             # Increment Excel color count
             excel_color_counts[color_type.lower()] += 1
             
-            actual_value = cell.value
-            reference_value = get_reference_value(column_name, page_side, ref_values)
+            meta = column_meta.get(col_idx)
+            if meta is None:
+                column_name = headers.get(col_idx, f"Column {col_idx}")
+                meta = column_meta[col_idx] = {
+                    "column_name": column_name,
+                    "is_bottom": is_bottom_measurement(column_name),
+                    "from_position": get_from_position(column_name),
+                    # Horizontal placement as a fraction of page width: column 1, column 2 or center
+                    "x_fraction": 0.25 if "Column 1" in column_name else 0.75 if "Column 2" in column_name else 0.5,
+                }
+            column_name = meta["column_name"]
+            ref_key = (column_name, page_side)
+            reference_value = ref_cache.get(ref_key, _MISSING)
+            if reference_value is _MISSING:
+                reference_value = ref_cache[ref_key] = get_reference_value(column_name, page_side, ref_values)
             
-            # Determine comment text based on color
-            if color_type == "PURPLE":
-                comment_text = "The two columns on this page do not align and they are not at their typical location."
-            elif color_type == "ORANGE":
-                comment_text = "This column is not aligned with the other column. The other column is in the correct position."
-            elif reference_value is not None:
-                comment_text = create_comment_text(column_name, actual_value, reference_value, color_type)
-            else:
-                from_position = "from the bottom" if is_bottom_measurement(column_name) else "from the side" if is_side_measurement(column_name) else "from the top"
-                comment_text = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. No reference available"
+            comment_text = create_comment_text(column_name, actual_value, reference_value, color_type, meta["from_position"])
             
-            paged_comments.append({
-                "page_num": page_num,
-                "y_inch": actual_value,
-                "comment": comment_text,
-                "color": color_type.lower(),
-                "column_name": column_name,
-                "is_bottom": is_bottom_measurement(column_name)
-            })
+            paged_comments.append(PagedComment(page_num, actual_value, comment_text, color_type.lower(),
+                                               meta["x_fraction"], meta["is_bottom"]))
+    
+    logging.info("Total annotations prepared: %s", len(paged_comments))
     
-    logging.info(f"Total annotations prepared: {len(paged_comments)}")
+    if incremental:
+        # Annotate a copy of the input so the save only appends the new objects; copied only
+        # now, so a failed Excel read never leaves an unannotated file under the output name
+        shutil.copyfile(pdf_file, output_pdf)
+        pdf_file = output_pdf
     
     try:
         doc = fitz.open(pdf_file)
     except Exception as e:
-        logging.error(f"Error opening PDF {pdf_file}: {e}")
+        logging.error("Error opening PDF %s: %s", pdf_file, e)
+        if incremental:
+            os.remove(output_pdf)
         return False
     
     # Track actual written annotations
     pdf_color_counts = {"red": 0, "yellow": 0, "orange": 0, "purple": 0}
     
-    for entry in paged_comments:
-        if entry["page_num"] < 1 or entry["page_num"] > len(doc):
+    # Walk the annotations page by page so each page is loaded once (the sort is stable,
+    # so annotations keep their sheet order within a page)
+    paged_comments.sort(key=itemgetter(0))
+    page_count = len(doc)
+    current_page_num = None
+    for page_num, y_inch, comment, color, x_fraction, is_bottom in paged_comments:
+        if page_num < 1 or page_num > page_count:
             continue
-        page = doc[entry["page_num"] - 1]
-        page_height = page.rect.height
+        if page_num != current_page_num:
+            current_page_num = page_num
+            page = doc[current_page_num - 1]
+            # page.rect builds a new Rect each access, so read it once per page
+            page_rect = page.rect
+            page_width = page_rect.width
+            page_height = page_rect.height
         
         # Horizontal placement
-        x_pts = page.rect.width / 2
-        if "Column 1" in entry["column_name"]:
-            x_pts = page.rect.width / 4
-        elif "Column 2" in entry["column_name"]:
-            x_pts = 3 * page.rect.width / 4
+        x_pts = page_width * x_fraction
         
         # Vertical placement
-        y_pts_pdf = page_height - (entry["y_inch"] * inch_to_pts) if entry["is_bottom"] else entry["y_inch"] * inch_to_pts
+        y_pts = y_inch * INCH_TO_PTS
+        y_pts_pdf = page_height - y_pts if is_bottom else y_pts
         y_pts_pdf = max(0, min(y_pts_pdf, page_height))
         
-        annot = page.add_text_annot((x_pts, y_pts_pdf), entry["comment"])
+        annot = page.add_text_annot((x_pts, y_pts_pdf), comment)
         annot.set_info(title="Margin Check")
         
         # Set colors
-        if entry["color"] == "red":
-            annot.set_colors(stroke=[1, 0, 0], fill=[1, 0.8, 0.8])
-        elif entry["color"] == "yellow":
-            annot.set_colors(stroke=[1, 1, 0], fill=[1, 1, 0.8])
-        elif entry["color"] == "orange":
-            annot.set_colors(stroke=[1, 0.6, 0], fill=[1, 0.9, 0.7])
-        elif entry["color"] == "purple":
-            annot.set_colors(stroke=[0.5, 0, 0.5], fill=[0.8, 0.7, 1])
+        stroke = _ANNOT_COLORS.get(color)
+        if stroke is not None:
+            annot.set_colors(stroke=stroke)
         
         annot.update()
-        pdf_color_counts[entry["color"]] += 1
+        pdf_color_counts[color] += 1
     
     # ===================== ADD COMPARISON SUMMARY =====================
     first_page = doc[0]
@@ -408,20 +414,57 @@ def process_file_pair(file_pair, ref_values):
     first_page.add_text_annot((50, 50), summary_text).set_info(title="Annotation Summary")
     
     try:
-        doc.save(output_pdf, incremental=False, garbage=4)
+        if incremental:
+            doc.saveIncr()
+        else:
+            # Nothing is removed from the source PDF, so the garbage-collection pass
+            # (xref compaction and duplicate merging) only runs when asked for
+            doc.save(output_pdf, incremental=False, garbage=4 if compact else 0, deflate=True)
         doc.close()
-        logging.info(f"Saved annotated PDF: {output_pdf}")
+        logging.info("Saved annotated PDF: %s", output_pdf)
     except Exception as e:
-        logging.error(f"Error saving PDF {output_pdf}: {e}")
+        logging.error("Error saving PDF %s: %s", output_pdf, e)
+        if incremental:
+            # A half-appended copy is not a result either
+            if not doc.is_closed:
+                doc.close()
+            os.remove(output_pdf)
         return False
     
-    logging.info(f"=== {base_name} Complete: {len(paged_comments)} annotations added ===")
+    logging.info("=== %s Complete: %s annotations added ===", base_name, len(paged_comments))
     return True
 
 
+def process_file_pair_worker(file_pair, ref_values, incremental=False, compact=False):
+    """Run process_file_pair in a pool worker, handing errors back instead of raising them."""
+    try:
+        return file_pair, process_file_pair(file_pair, ref_values, incremental, compact), None
+    except Exception as e:
+        logging.error("Unexpected error processing %s: %s", file_pair['base_name'], e)
+        return file_pair, False, e
+    finally:
+        flush_logs()
+
+
 def main():
     """Main function."""
-    log_file = setup_logging()
+    parser = argparse.ArgumentParser(description="Annotate PDFs with margin checks from their matching Excel files.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="copy each PDF to its output name and append the annotations with an incremental save "
+             "instead of rewriting the whole file (faster for large PDFs)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="run a full garbage-collection pass when saving for the smallest output (slower); "
+             "ignored with --incremental"
+    )
+    args = parser.parse_args()
+    
+    # Progress goes to the log file; the console only shows warnings and errors
+    log_file = setup_logging(console_level=logging.WARNING)
     
     # Load reference values (still needed for all files)
     ref_values = load_reference_values(reference_file)
@@ -435,41 +478,50 @@ def main():
         print("Make sure you have matching PDF and XLSX files (same name, different extensions)")
         sys.exit(1)
     
-    logging.info(f"Found {len(file_pairs)} file pair(s) to process")
+    logging.info("Found %s file pair(s) to process", len(file_pairs))
     
     # Process each file pair
     total_processed = 0
     total_failed = 0
     comparison_results = []
     
-    for file_pair in file_pairs:
-        try:
-            result = process_file_pair(file_pair, ref_values)
-            if result:
-                total_processed += 1
-                comparison_results.append((file_pair['base_name'], result))
-                print(f"✓ Successfully processed: {file_pair['base_name']}")
-                
-                # Print comparison results for this file
-                print(f"  Comparison results:")
-                for color in ["RED", "YELLOW", "PURPLE", "ORANGE"]:
-                    expected = result["expected"][color]
-                    actual = result["actual"][color]
-                    status = "✓" if expected == actual else "✗"
-                    print(f"    {color}: {expected} expected, {actual} written {status}")
+    # Each pair is independent, so fan them out across worker processes
+    num_workers = min(os.cpu_count() or 1, 4)
+    worker = partial(process_file_pair_worker, ref_values=ref_values, incremental=args.incremental, compact=args.compact)
+    # Workers get their own log files only when there is a main log file to name them after
+    initializer, initargs = (init_worker, (log_file, logging.WARNING)) if log_file else (None, ())
+    with multiprocessing.Pool(num_workers, initializer=initializer, initargs=initargs) as pool:
+        for file_pair, result, error in pool.imap_unordered(worker, file_pairs):
+            if error is not None:
+                total_failed += 1
+                print(f"✗ Failed to process: {file_pair['base_name']} - {error}")
+                continue
+            try:
+                if result:
+                    total_processed += 1
+                    comparison_results.append((file_pair['base_name'], result))
+                    print(f"✓ Successfully processed: {file_pair['base_name']}")
                     
-            else:
+                    # Print comparison results for this file
+                    print(f"  Comparison results:")
+                    for color in ["RED", "YELLOW", "PURPLE", "ORANGE"]:
+                        expected = result["expected"][color]
+                        actual = result["actual"][color]
+                        status = "✓" if expected == actual else "✗"
+                        print(f"    {color}: {expected} expected, {actual} written {status}")
+                        
+                else:
+                    total_failed += 1
+                    print(f"✗ Failed to process: {file_pair['base_name']}")
+            except Exception as e:
+                logging.error("Unexpected error processing %s: %s", file_pair['base_name'], e)
                 total_failed += 1
-                print(f"✗ Failed to process: {file_pair['base_name']}")
-        except Exception as e:
-            logging.error(f"Unexpected error processing {file_pair['base_name']}: {e}")
-            total_failed += 1
-            print(f"✗ Failed to process: {file_pair['base_name']} - {e}")
+                print(f"✗ Failed to process: {file_pair['base_name']} - {e}")
     
     # Final summary
-    logging.info(f"=== BATCH PROCESSING COMPLETE ===")
-    logging.info(f"Successfully processed: {total_processed}")
-    logging.info(f"Failed: {total_failed}")
+    logging.info("=== BATCH PROCESSING COMPLETE ===")
+    logging.info("Successfully processed: %s", total_processed)
+    logging.info("Failed: %s", total_failed)
     
     print(f"\n=== BATCH PROCESSING COMPLETE ===")
     print(f"Successfully processed: {total_processed} files")
@@ -499,6 +551,8 @@ def main():
     
     if total_processed > 0:
         print(f"\nAnnotated PDFs saved with '_annotated' suffix")
+    
+    logging.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,256 @@
+# annotator_common.py
+# Setup and Excel reading shared by the PDF margin annotators
+
+import logging
+import logging.handlers
+import sys
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from functools import lru_cache
+
+# Configure logging
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def build_log_handlers(log_filename, console_level=logging.INFO):
+    """Buffered file handler plus a stdout handler that shows records from console_level up."""
+    # Records reach the file in chunks of 1000 (or at once on an ERROR), not one write per line;
+    # the buffer hands records to its target as-is, so the target carries the formatter
+    target = logging.FileHandler(log_filename, delay=True)
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+    file_handler = logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.ERROR, target=target)
+    file_handler.setLevel(logging.INFO)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(console_level)
+    return [file_handler, console_handler]
+
+def flush_logs():
+    """Push buffered records to the log file; pool workers exit without running atexit hooks."""
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
+def _configured_log_file():
+    """Log file of the root logger's file handler (buffered or not), or None if it has none."""
+    for handler in logging.getLogger().handlers:
+        filename = getattr(getattr(handler, "target", None) or handler, "baseFilename", None)
+        if filename:
+            return filename
+    return None
+
+@lru_cache(maxsize=1)
+def setup_logging(log_prefix="pdf_margin_annotator", title="PDF Margin Annotator", console_level=logging.INFO):
+    """Set up detailed logging for troubleshooting and return the log file in use.
+    Returns None only if logging was already configured without a log file."""
+    # Logging already configured in this process (e.g. both annotators imported together)
+    if logging.getLogger().handlers:
+        return _configured_log_file()
+
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_filename = f'logs/{log_prefix}_{timestamp}.log'
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=build_log_handlers(log_filename, console_level)
+    )
+
+    logging.info("=== %s Started ===", title)
+    logging.info("Log file: %s", log_filename)
+    return log_filename
+
+def init_worker(log_filename, console_level=logging.INFO):
+    """Give each pool worker its own log file next to the main one."""
+    root, ext = os.path.splitext(log_filename)
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=build_log_handlers(f"{root}_worker{os.getpid()}{ext}", console_level),
+        force=True
+    )
+
+# === MEASUREMENT COLUMNS ===
+# Column layout of the Left/Right margin sheets read by PDFWriter.py and pdf_annotator_enhancements.py
+_BOTTOM_MEASUREMENTS = frozenset({
+    "Bottom Scripture Baseline Left (in)",
+    "Bottom Scripture Baseline Right (in)",
+    "Bottom Scripture Baseline Column 1 (in)",
+    "Bottom Scripture Baseline Column 2 (in)",
+    "Footnote Baseline (in)",
+    "Book Intro Baseline (in)",
+    "Study Note Baseline (in)",
+    "Article Baseline (in)",
+    "Box Baseline (in)"
+})
+
+def is_bottom_measurement(column_name):
+    return column_name in _BOTTOM_MEASUREMENTS
+
+_SIDE_MEASUREMENTS = frozenset({
+    "Column 1 Left Edge (in)",
+    "Column 1 Right Edge (in)",
+    "Column 2 Left Edge (in)",
+    "Column 2 Right Edge (in)",
+    "Column 1 Max Width (in)",
+    "Column 2 Max Width (in)",
+    "Column Gap Width (in)"
+})
+
+def is_side_measurement(column_name):
+    return column_name in _SIDE_MEASUREMENTS
+
+def get_from_position(column_name):
+    if is_bottom_measurement(column_name):
+        return "from the bottom"
+    elif is_side_measurement(column_name):
+        return "from the side"
+    return "from the top"
+
+_COLUMN_MAPPINGS = {
+    "Top Scripture Baseline Left (in)": "Top",
+    "Top Scripture Baseline Right (in)": "Top",
+    "Bottom Scripture Baseline Left (in)": "Bottom",
+    "Bottom Scripture Baseline Right (in)": "Bottom",
+    "Footnote Baseline (in)": "Footnote",
+    "Book Intro Baseline (in)": "Book Intro",
+    "Study Note Baseline (in)": "Study Note",
+    "Article Baseline (in)": "Article",
+    "Running Head Baseline (in)": "Running Head",
+    "Page Number Baseline (in)": "Page Number",
+    "Column 1 Max Width (in)": "Column 1 Max Width (in)",
+    "Column 2 Max Width (in)": "Column 2 Max Width (in)",
+    "Column Gap Width (in)": "Column Gap Width (in)",
+    "Box Baseline (in)": "Box Baseline"
+}
+_PAGE_SIDE_TEMPLATES = {
+    "Column 1 Left Edge (in)": "{side} Pages - Column 1 Left Edge (in)",
+    "Column 1 Right Edge (in)": "{side} Pages - Column 1 Right Edge (in)",
+    "Column 2 Left Edge (in)": "{side} Pages - Column 2 Left Edge (in)",
+    "Column 2 Right Edge (in)": "{side} Pages - Column 2 Right Edge (in)"
+}
+
+def get_reference_key(column_name, page_side):
+    if column_name in _PAGE_SIDE_TEMPLATES:
+        return _PAGE_SIDE_TEMPLATES[column_name].format(side=page_side)
+    return _COLUMN_MAPPINGS.get(column_name)
+
+def build_reference_keys(column_names, sides=("Left", "Right")):
+    """Flat (column_name, page_side) -> reference key table for the given columns"""
+    return {(name, side): get_reference_key(name, side) for name in column_names for side in sides}
+
+def get_reference_value(column_name, page_side, ref_values, ref_keys=None):
+    key = (column_name, page_side)
+    if ref_keys is not None and key in ref_keys:
+        return ref_values.get(ref_keys[key])
+    return ref_values.get(get_reference_key(column_name, page_side))
+
+# === EXCEL READING ===
+# The workbook is read straight from the .xlsx zip: only shared strings, the
+# cell styles and the active sheet are parsed, and the sheet is streamed row by row.
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+def _parse_shared_strings(z):
+    if "xl/sharedStrings.xml" not in z.namelist():
+        return []
+    shared = []
+    with z.open("xl/sharedStrings.xml") as xml_file:
+        for event, elem in ET.iterparse(xml_file):
+            if elem.tag == f"{SHEET_NS}si":
+                # Interned so headers and labels repeated across a worker's workbooks share one object
+                shared.append(sys.intern(_inline_text(elem)))
+                elem.clear()
+    return shared
+
+def _inline_text(elem):
+    # Plain <t> plus any rich-text runs; phonetic runs are ignored like openpyxl does
+    text = elem.find(f"{SHEET_NS}t")
+    parts = [text.text or ""] if text is not None else []
+    for run in elem.findall(f"{SHEET_NS}r"):
+        run_text = run.find(f"{SHEET_NS}t")
+        if run_text is not None:
+            parts.append(run_text.text or "")
+    return "".join(parts)
+
+def _parse_colored_styles(z, get_fill_color):
+    """Return {cell style index: color name} for styles whose fill get_fill_color recognises"""
+    styles = ET.fromstring(z.read("xl/styles.xml"))
+    fill_colors = [get_fill_color(fill.find(f"{SHEET_NS}patternFill"))
+                   for fill in styles.iterfind(f"{SHEET_NS}fills/{SHEET_NS}fill")]
+    colored_styles = {}
+    for style_id, xf in enumerate(styles.iterfind(f"{SHEET_NS}cellXfs/{SHEET_NS}xf")):
+        fill_id = int(xf.get("fillId", 0))
+        if fill_id < len(fill_colors) and fill_colors[fill_id] is not None:
+            colored_styles[style_id] = fill_colors[fill_id]
+    return colored_styles
+
+def _active_sheet_path(z):
+    workbook = ET.fromstring(z.read("xl/workbook.xml"))
+    view = workbook.find(f"{SHEET_NS}bookViews/{SHEET_NS}workbookView")
+    active = int(view.get("activeTab", 0)) if view is not None else 0
+    sheets = workbook.findall(f"{SHEET_NS}sheets/{SHEET_NS}sheet")
+    rel_id = sheets[active].get(f"{_REL_NS}id")
+    for rel in ET.fromstring(z.read("xl/_rels/workbook.xml.rels")):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            return target[1:] if target.startswith("/") else f"xl/{target}"
+    raise KeyError(f"No worksheet found for sheet relationship {rel_id}")
+
+def _column_index(ref):
+    col = 0
+    for char in ref:
+        if char.isdigit():
+            break
+        col = col * 26 + ord(char.upper()) - 64
+    return col
+
+def _cast_number(value):
+    # Same rule openpyxl uses: anything with a decimal point or exponent is a float
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+def _cell_value(c, shared):
+    cell_type = c.get("t", "n")
+    if cell_type == "inlineStr":
+        inline = c.find(f"{SHEET_NS}is")
+        return _inline_text(inline) if inline is not None else None
+    v = c.find(f"{SHEET_NS}v")
+    if v is None or v.text is None:
+        return None
+    if cell_type == "n":
+        return _cast_number(v.text)
+    if cell_type == "s":
+        return shared[int(v.text)]
+    if cell_type == "b":
+        return bool(int(v.text))
+    return v.text
+
+def _stream_sheet(excel_file, sheet_path, shared):
+    """Yield (row_num, {col: (value, style_id)}) for each row, one row in memory at a time"""
+    with zipfile.ZipFile(excel_file) as z, z.open(sheet_path) as sheet_xml:
+        row_num = 0
+        for event, elem in ET.iterparse(sheet_xml):
+            if elem.tag != f"{SHEET_NS}row":
+                continue
+            row_num = int(elem.get("r", row_num + 1))
+            cells = {}
+            col = 0
+            for c in elem.iterfind(f"{SHEET_NS}c"):
+                ref = c.get("r")
+                col = _column_index(ref) if ref else col + 1
+                cells[col] = (_cell_value(c, shared), int(c.get("s", 0)))
+            elem.clear()
+            yield row_num, cells
+
+def read_sheet(excel_file, get_fill_color):
+    """Return (colored_styles, rows) for the workbook's active sheet; rows is a lazy stream.
+    get_fill_color maps a <patternFill> element (or None) to a color name or None."""
+    with zipfile.ZipFile(excel_file) as z:
+        shared = _parse_shared_strings(z)
+        colored_styles = _parse_colored_styles(z, get_fill_color)
+        sheet_path = _active_sheet_path(z)
+    return colored_styles, _stream_sheet(excel_file, sheet_path, shared)
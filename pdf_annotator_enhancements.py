@@ -1,138 +1,115 @@
 # PDFWriter_extended.py
 
-import openpyxl
 import fitz  # PyMuPDF
 import logging
 import sys
 import os
-import glob
-from datetime import datetime
-from collections import defaultdict
+import re
+from collections import defaultdict, namedtuple
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Configure logging
-def setup_logging():
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f'logs/pdf_margin_annotator_extended_{timestamp}.log'
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    logging.info("=== PDF Margin Annotator Extended Started ===")
-    logging.info(f"Log file: {log_filename}")
-    return log_filename
+from annotator_common import (SHEET_NS, build_reference_keys, flush_logs, get_from_position, get_reference_value,
+                              init_worker, is_bottom_measurement, read_sheet, setup_logging)
+
+logger = logging.getLogger(__name__)
 
 # === CONFIG ===
 reference_file = "margin_baseline_reference.txt"
+INCH_TO_PTS = 72
 
 # === COLOR DETECTION ===
-def get_cell_color(cell):
-    """Detect cell color and return color type as string"""
-    try:
-        if cell.fill.fill_type != 'solid' or not cell.fill.start_color.rgb:
-            return None
-        
-        rgb = cell.fill.start_color.rgb.upper()
-        
-        # Check for the specific RGB values found in your Excel file
-        if rgb == "00FFC7CE":  # Red
-            return "RED"
-        elif rgb == "00FFEB9C":  # Yellow
-            return "YELLOW"
-        elif rgb == "00800080":  # Purple
-            return "PURPLE"
-        elif rgb == "00FFC000":  # Orange
-            return "ORANGE"
-        else:
-            # Fallback to partial matching
-            if "FFC7CE" in rgb or "C7CE" in rgb:  # Red
-                return "RED"
-            elif "FFEB9C" in rgb or "EB9C" in rgb:  # Yellow
-                return "YELLOW"
-            elif "800080" in rgb:  # Purple
-                return "PURPLE"
-            elif "FFC000" in rgb or "C000" in rgb:  # Orange
-                return "ORANGE"
-            else:
-                logging.warning(f"Unknown color RGB: {rgb}")
-                return None
-    except Exception as e:
-        logging.debug(f"Error detecting cell color: {e}")
+# The specific RGB values found in your Excel file
+_COLOR_MAP = {
+    "00FFC7CE": "RED",
+    "00FFEB9C": "YELLOW",
+    "00800080": "PURPLE",
+    "00FFC000": "ORANGE"
+}
+# Fallback partial matching for anything not in _COLOR_MAP, checked in priority order
+# (red, yellow, purple, orange); the short fragments also cover the full hex values
+_COLOR_FRAGMENTS = (
+    ("C7CE", "RED"),
+    ("EB9C", "YELLOW"),
+    ("800080", "PURPLE"),
+    ("C000", "ORANGE")
+)
+
+def get_fill_color(pattern_fill):
+    """Detect a <patternFill> element's color and return color type as string"""
+    if pattern_fill is None or pattern_fill.get("patternType") != "solid":
         return None
+    fg_color = pattern_fill.find(f"{SHEET_NS}fgColor")
+    # Theme/indexed colors have no usable rgb string
+    rgb = fg_color.get("rgb") if fg_color is not None else None
+    if not rgb:
+        return None
+    
+    rgb = rgb.upper()
+    color_type = _COLOR_MAP.get(rgb)
+    if color_type is not None:
+        return color_type
+    for fragment, fragment_color in _COLOR_FRAGMENTS:
+        if fragment in rgb:
+            return fragment_color
+    logger.warning("Unknown color RGB: %s", rgb)
+    return None
 
 # === LOAD REFERENCE VALUES ===
+# "key: number" on one line; the key runs up to the first colon
+_REF_LINE = re.compile(r"^([^:\n]*):[ \t]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)[ \t\r]*$", re.M)
+
 def load_reference_values(ref_file_path):
-    logging.info(f"Loading reference values from: {ref_file_path}")
-    ref_values = {}
+    logger.info("Loading reference values from: %s", ref_file_path)
     try:
         with open(ref_file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    try:
-                        ref_values[key.strip()] = float(value.strip())
-                    except ValueError:
-                        continue
-        logging.info(f"Loaded {len(ref_values)} reference values")
+            text = f.read()
+        # Lines that are not "key: number" are skipped, as before
+        ref_values = {key.strip(): float(value) for key, value in _REF_LINE.findall(text)}
+        logger.info("Loaded %s reference values", len(ref_values))
         return ref_values
     except FileNotFoundError:
-        logging.error(f"Reference file '{ref_file_path}' not found")
+        logger.error("Reference file '%s' not found", ref_file_path)
         sys.exit(1)
     except Exception as e:
-        logging.error(f"Error reading reference file: {e}")
+        logger.error("Error reading reference file: %s", e)
         sys.exit(1)
 
 # === FIND FILE PAIRS ===
 def find_pdf_excel_pairs():
-    pdf_files = glob.glob("*.pdf")
+    # One scandir pass buckets files by stem, so pairing needs no further stat calls
+    files_by_stem = {}
+    with os.scandir('.') as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            stem, ext = os.path.splitext(entry.name)
+            files_by_stem.setdefault(stem, {})[ext.lower()] = entry.name
     pairs = []
-    for pdf_file in pdf_files:
+    for base_name, files in files_by_stem.items():
+        pdf_file = files.get('.pdf')
         # Skip already annotated files
-        if "_annotated" in pdf_file:
+        if pdf_file is None or "_annotated" in pdf_file:
             continue
             
-        base_name = os.path.splitext(pdf_file)[0]
-        excel_file = f"{base_name}.xlsx"
-        if os.path.exists(excel_file):
+        excel_file = files.get('.xlsx')
+        if excel_file is not None:
             output_pdf = f"{base_name}_annotated.pdf"
             pairs.append({'pdf': pdf_file, 'excel': excel_file, 'output': output_pdf, 'base_name': base_name})
-            logging.info(f"Found pair: {pdf_file} + {excel_file}")
+            logger.info("Found pair: %s + %s", pdf_file, excel_file)
         else:
-            logging.warning(f"PDF found but no matching Excel file: {pdf_file}")
+            logger.warning("PDF found but no matching Excel file: %s", pdf_file)
     return pairs
 
 # === POSITION HELPERS ===
-def is_bottom_measurement(column_name):
-    bottom_measurements = {
-        "Bottom Scripture Baseline Left (in)",
-        "Bottom Scripture Baseline Right (in)",
-        "Bottom Scripture Baseline Column 1 (in)",
-        "Bottom Scripture Baseline Column 2 (in)",
-        "Footnote Baseline (in)",
-        "Book Intro Baseline (in)",
-        "Study Note Baseline (in)",
-        "Article Baseline (in)",
-        "Box Baseline (in)"
-    }
-    return column_name in bottom_measurements
-
-def is_side_measurement(column_name):
-    side_measurements = {
-        "Column 1 Left Edge (in)",
-        "Column 1 Right Edge (in)",
-        "Column 2 Left Edge (in)", 
-        "Column 2 Right Edge (in)",
-        "Column 1 Max Width (in)",
-        "Column 2 Max Width (in)",
-        "Column Gap Width (in)"
-    }
-    return column_name in side_measurements
+def get_x_fraction(column_name):
+    """Horizontal placement as a fraction of page width: over Column 1, Column 2, or centered"""
+    if "Column 1" in column_name:
+        return 0.25
+    elif "Column 2" in column_name:
+        return 0.75
+    return 0.5
 
 def create_comment_text(column_name, actual_value, reference_value, color_type):
     # Special handling for purple and orange annotations
@@ -148,12 +125,7 @@ def create_comment_text(column_name, actual_value, reference_value, color_type):
             return "This column is not aligned with the other column. The other column is in the correct position."
     
     # Standard handling for red and yellow annotations
-    if is_bottom_measurement(column_name):
-        from_position = "from the bottom"
-    elif is_side_measurement(column_name):
-        from_position = "from the side"
-    else:
-        from_position = "from the top"
+    from_position = get_from_position(column_name)
     
     if reference_value is not None:
         comment = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. Normally text is {reference_value}"
@@ -161,33 +133,18 @@ def create_comment_text(column_name, actual_value, reference_value, color_type):
         comment = f"{color_type} {column_name}. Text is {actual_value} inches {from_position}. No reference available"
     return comment
 
-# === GET REFERENCE VALUE ===
-def get_reference_value(column_name, page_side, ref_values):
-    column_mappings = {
-        "Top Scripture Baseline Left (in)": "Top",
-        "Top Scripture Baseline Right (in)": "Top",
-        "Bottom Scripture Baseline Left (in)": "Bottom",
-        "Bottom Scripture Baseline Right (in)": "Bottom",
-        "Footnote Baseline (in)": "Footnote",
-        "Book Intro Baseline (in)": "Book Intro",
-        "Study Note Baseline (in)": "Study Note",
-        "Article Baseline (in)": "Article",
-        "Running Head Baseline (in)": "Running Head",
-        "Page Number Baseline (in)": "Page Number",
-        "Column 1 Max Width (in)": "Column 1 Max Width (in)",
-        "Column 2 Max Width (in)": "Column 2 Max Width (in)",
-        "Column Gap Width (in)": "Column Gap Width (in)",
-        "Box Baseline (in)": "Box Baseline"
-    }
-    page_side_mappings = {
-        "Column 1 Left Edge (in)": f"{page_side} Pages - Column 1 Left Edge (in)",
-        "Column 1 Right Edge (in)": f"{page_side} Pages - Column 1 Right Edge (in)", 
-        "Column 2 Left Edge (in)": f"{page_side} Pages - Column 2 Left Edge (in)",
-        "Column 2 Right Edge (in)": f"{page_side} Pages - Column 2 Right Edge (in)"
-    }
-    if column_name in page_side_mappings:
-        return ref_values.get(page_side_mappings[column_name])
-    return ref_values.get(column_mappings.get(column_name))
+# === ANNOTATION COLORS ===
+# entry color -> (count key, stroke). Text annotations have no interior color, so
+# MuPDF drops any fill passed to set_colors (printing a warning for each one)
+_COLOR_TABLE = {
+    "red": ("RED", [1, 0, 0]),
+    "yellow": ("YELLOW", [1, 1, 0]),
+    "orange": ("ORANGE", [1, 0.6, 0]),
+    "purple": ("PURPLE", [0.5, 0, 0.5])
+}
+
+# One prepared margin note; a tuple per entry instead of a dict
+PagedComment = namedtuple("PagedComment", "page_num y_inch comment color is_bottom x_fraction")
 
 # === MAIN PROCESSING FUNCTION ===
 def process_file_pair(file_pair, ref_values):
@@ -196,114 +153,118 @@ def process_file_pair(file_pair, ref_values):
     output_pdf = file_pair['output']
     base_name = file_pair['base_name']
     
-    logging.info(f"=== Processing {base_name} ===")
-    
-    inch_to_pts = 72
+    logger.info("=== Processing %s ===", base_name)
     
     try:
-        wb = openpyxl.load_workbook(excel_file)
-        ws = wb.active
+        # Styles are classified once up front; the sheet itself is streamed row by row
+        colored_styles, sheet_rows = read_sheet(excel_file, get_fill_color)
     except Exception as e:
-        logging.error(f"Error loading Excel {excel_file}: {e}")
+        logger.error("Error loading Excel %s: %s", excel_file, e)
         return False
     
-    headers = {col: ws.cell(row=1, column=col).value for col in range(1, ws.max_column + 1) if ws.cell(row=1, column=col).value}
+    headers = {}
+    ref_keys = {}
+    # Per-column (name, is_bottom, x_fraction), derived once per column instead of per cell
+    col_meta = {}
     
     paged_comments = []
     
     # Track color counts in Excel
     excel_color_counts = {"RED": 0, "YELLOW": 0, "ORANGE": 0, "PURPLE": 0}
     
-    for row_num, row in enumerate(ws.iter_rows(min_row=2), start=2):
-        try:
-            page_num = int(row[0].value)
-            page_side = row[1].value
-        except:
+    # Per-cell method lookups bound once for the row loop
+    style_color = colored_styles.get
+    add_comment = paged_comments.append
+    
+    for row_num, cells in sheet_rows:
+        if row_num == 1:
+            headers = {col: value for col, (value, style_id) in cells.items() if value}
+            # Every reference key this sheet can need, resolved once up front
+            ref_keys = build_reference_keys(headers.values())
             continue
+        if 1 not in cells:
+            continue
+        page_value = cells[1][0]
+        # Page numbers are stored as ints; only anything else needs a checked int()
+        if type(page_value) is int:
+            page_num = page_value
+        else:
+            try:
+                page_num = int(page_value)
+            except (ValueError, TypeError):
+                continue
+        # An empty Page Side cell still gets its annotations, just without side-specific references
+        page_side = cells.get(2, (None, 0))[0]
         
-        for col_idx, cell in enumerate(row[2:], start=3):
-            if cell.value is None or cell.value == "N/A":
+        for col_idx, (value, style_id) in cells.items():
+            # Most cells are unfilled, so the style lookup is the cheapest first filter
+            color_type = style_color(style_id)
+            if color_type is None or col_idx < 3:
                 continue
-            
-            column_name = headers.get(col_idx, f"Column {col_idx}")
-            color_type = get_cell_color(cell)
-            if color_type is None:
+            if value is None or value == "N/A":
                 continue
             
+            meta = col_meta.get(col_idx)
+            if meta is None:
+                column_name = headers.get(col_idx, f"Column {col_idx}")
+                meta = col_meta[col_idx] = (column_name, is_bottom_measurement(column_name), get_x_fraction(column_name))
+            column_name, is_bottom, x_fraction = meta
+            
             # Increment Excel color count
             excel_color_counts[color_type] += 1
             
-            actual_value = cell.value
-            reference_value = get_reference_value(column_name, page_side, ref_values)
+            actual_value = value
+            reference_value = get_reference_value(column_name, page_side, ref_values, ref_keys)
             
             comment_text = create_comment_text(column_name, actual_value, reference_value, color_type)
             
-            paged_comments.append({
-                "page_num": page_num,
-                "y_inch": actual_value,
-                "comment": comment_text,
-                "color": color_type.lower(),
-                "column_name": column_name,
-                "is_bottom": is_bottom_measurement(column_name),
-                "color_type": color_type  # Keep original color type for placement logic
-            })
+            add_comment(PagedComment(page_num, actual_value, comment_text, color_type.lower(), is_bottom, x_fraction))
     
-    logging.info(f"Total annotations prepared: {len(paged_comments)}")
-    logging.info(f"Excel color counts: {excel_color_counts}")
+    logger.info("Total annotations prepared: %s", len(paged_comments))
+    logger.info("Excel color counts: %s", excel_color_counts)
     
     try:
         doc = fitz.open(pdf_file)
     except Exception as e:
-        logging.error(f"Error opening PDF {pdf_file}: {e}")
+        logger.error("Error opening PDF %s: %s", pdf_file, e)
         return False
     
     # Track actual written annotations
     pdf_color_counts = {"RED": 0, "YELLOW": 0, "ORANGE": 0, "PURPLE": 0}
     
-    for entry in paged_comments:
-        if entry["page_num"] < 1 or entry["page_num"] > len(doc):
+    # Group by page so each page is looked up and measured once
+    paged_comments.sort(key=itemgetter(0))
+    page_count = len(doc)
+    
+    for page_num, entries in groupby(paged_comments, key=itemgetter(0)):
+        if page_num < 1 or page_num > page_count:
             continue
-            
-        page = doc[entry["page_num"] - 1]
-        page_height = page.rect.height
-        
-        # Horizontal placement - SPECIAL HANDLING FOR ORANGE
-        if entry["color_type"] == "ORANGE":
-            # Place over the specific column that is orange
-            if "Column 1" in entry["column_name"]:
-                x_pts = page.rect.width / 4  # Over Column 1
-            elif "Column 2" in entry["column_name"]:
-                x_pts = 3 * page.rect.width / 4  # Over Column 2
-            else:
-                x_pts = page.rect.width / 2  # Default center
-        else:
-            # Standard placement for other colors
-            x_pts = page.rect.width / 2
-            if "Column 1" in entry["column_name"]:
-                x_pts = page.rect.width / 4
-            elif "Column 2" in entry["column_name"]:
-                x_pts = 3 * page.rect.width / 4
-        
-        # Vertical placement follows top/bottom rule
-        y_pts_pdf = page_height - (entry["y_inch"] * inch_to_pts) if entry["is_bottom"] else entry["y_inch"] * inch_to_pts
-        y_pts_pdf = max(0, min(y_pts_pdf, page_height))
         
-        # Use text annotation instead of freetext to allow colors
-        annot = page.add_text_annot((x_pts, y_pts_pdf), entry["comment"])
-        annot.set_info(title="Margin Check")
+        page = doc[page_num - 1]
+        # page.rect builds a new Rect each access, so read it once per page
+        page_rect = page.rect
+        page_width = page_rect.width
+        page_height = page_rect.height
         
-        # Set colors
-        if entry["color"] == "red":
-            annot.set_colors(stroke=[1, 0, 0], fill=[1, 0.8, 0.8])
-        elif entry["color"] == "yellow":
-            annot.set_colors(stroke=[1, 1, 0], fill=[1, 1, 0.8])
-        elif entry["color"] == "orange":
-            annot.set_colors(stroke=[1, 0.6, 0], fill=[1, 0.9, 0.7])
-        elif entry["color"] == "purple":
-            annot.set_colors(stroke=[0.5, 0, 0.5], fill=[0.8, 0.7, 1])
-        
-        annot.update()
-        pdf_color_counts[entry["color_type"]] += 1
+        for _, y_inch, comment, color, is_bottom, x_fraction in entries:
+            # Horizontal placement over the flagged column (orange included)
+            x_pts = page_width * x_fraction
+            
+            # Vertical placement follows top/bottom rule
+            y_pts = y_inch * INCH_TO_PTS
+            y_pts_pdf = page_height - y_pts if is_bottom else y_pts
+            y_pts_pdf = max(0, min(y_pts_pdf, page_height))
+            
+            # Use text annotation instead of freetext to allow colors
+            annot = page.add_text_annot((x_pts, y_pts_pdf), comment)
+            annot.set_info(title="Margin Check")
+            
+            # Set colors and count the annotation under its color
+            color_key, stroke = _COLOR_TABLE[color]
+            annot.set_colors(stroke=stroke)
+            
+            annot.update()
+            pdf_color_counts[color_key] += 1
     
     # ===================== ADD COMPARISON SUMMARY =====================
     first_page = doc[0]
@@ -332,39 +293,60 @@ def process_file_pair(file_pair, ref_values):
     annot = first_page.add_text_annot((50, 50), summary_text)
     annot.set_info(title="Annotation Summary")
     # For text annotations, we can set colors
-    annot.set_colors(stroke=[0, 0, 0], fill=[1, 1, 0.9])  # Light yellow with black border
+    annot.set_colors(stroke=[0, 0, 0])  # Black icon
     annot.update()
     
-    logging.info(f"PDF color counts: {pdf_color_counts}")
+    logger.info("PDF color counts: %s", pdf_color_counts)
     
     try:
-        doc.save(output_pdf, incremental=False, garbage=4)
+        # Only annotations are added: deflate the new streams, skip the garbage=4 xref compaction
+        # (use garbage=2 if duplicate objects ever need to be dropped for size)
+        doc.save(output_pdf, incremental=False, garbage=0, deflate=True)
         doc.close()
-        logging.info(f"Saved annotated PDF: {output_pdf}")
+        logger.info("Saved annotated PDF: %s", output_pdf)
     except Exception as e:
-        logging.error(f"Error saving PDF {output_pdf}: {e}")
+        logger.error("Error saving PDF %s: %s", output_pdf, e)
         return False
     
-    logging.info(f"=== {base_name} Complete: {len(paged_comments)} annotations added ===")
+    logger.info("=== %s Complete: %s annotations added ===", base_name, len(paged_comments))
     return True
 
+def process_file_pair_worker(file_pair, ref_values):
+    """Run process_file_pair in a pool worker; buffered log records are flushed before it returns"""
+    try:
+        return process_file_pair(file_pair, ref_values)
+    finally:
+        flush_logs()
+
 # === MAIN ===
 def main():
-    setup_logging()
+    log_filename = setup_logging("pdf_margin_annotator_extended", "PDF Margin Annotator Extended")
     ref_values = load_reference_values(reference_file)
     file_pairs = find_pdf_excel_pairs()
     
     if not file_pairs:
-        logging.error("No PDF/Excel file pairs found!")
+        logger.error("No PDF/Excel file pairs found!")
         sys.exit(1)
 
     success_count = 0
-    for pair in file_pairs:
-        if process_file_pair(pair, ref_values):
-            success_count += 1
-            print(f"✓ Successfully processed: {pair['base_name']}")
-        else:
-            print(f"✗ Failed to process: {pair['base_name']}")
+    # Pairs share nothing but the read-only reference dict, so each gets its own process
+    workers = min(len(file_pairs), os.cpu_count() or 1)
+    # Workers get their own log files only when there is a main log file to name them after
+    initializer, initargs = (init_worker, (log_filename,)) if log_filename else (None, ())
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        futures = {executor.submit(process_file_pair_worker, pair, ref_values): pair for pair in file_pairs}
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                success = future.result()
+            except Exception as e:
+                logger.error("Worker failed on %s: %s", pair['base_name'], e)
+                success = False
+            if success:
+                success_count += 1
+                print(f"✓ Successfully processed: {pair['base_name']}")
+            else:
+                print(f"✗ Failed to process: {pair['base_name']}")
     
     print(f"\n=== BATCH COMPLETE ===")
     print(f"Successfully processed: {success_count}")